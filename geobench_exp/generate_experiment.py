@@ -85,11 +85,12 @@ def experiment_generator(task_config_path: str, model_config_path: str) -> None:
         print(task_specs.dataset_name)
         task_config = copy.deepcopy(config)
         task_config = get_band_names(task_config, task_specs)
+        task_dir = experiment_dir / task_specs.dataset_name
 
         for i in range(config["experiment"]["num_seeds"]):
             # set seed to be used in experiment
             task_config["experiment"]["seed"] = i
-            job_dir = experiment_dir / task_specs.dataset_name / f"seed_{i}"
+            job_dir = task_dir / f"seed_{i}"
             job = Job(job_dir)
             job.save_config(task_config)
             job.save_task_specs(task_specs)
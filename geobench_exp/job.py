@@ -80,10 +80,19 @@ class Job:
         else:
             try:
                 with open(self.dir / "csv_logs" / "version_0" / "metrics.csv", "r") as fd:
-                    data: Dict[str, Any] = {}  # type: ignore[no-redef]
-                    # FIXME: This would be more efficient if done backwards
-                    for entry in csv.DictReader(fd):
-                        data.update({k: v for k, v in entry.items() if v != ""})
+                    lines = fd.read().splitlines()
+                data: Dict[str, Any] = {}  # type: ignore[no-redef]
+                if not lines:
+                    return data
+                fieldnames = next(csv.reader(lines[:1]))
+                # walk the rows backwards, keeping the last logged value of each column,
+                # and stop parsing as soon as every column has been seen
+                for entry in csv.DictReader(reversed(lines[1:]), fieldnames=fieldnames):
+                    for k, v in entry.items():
+                        if v != "" and k not in data:
+                            data[k] = v
+                    if len(data) == len(fieldnames):
+                        break
                 return data
             except FileNotFoundError as e:
                 stderr = self.get_stderr()
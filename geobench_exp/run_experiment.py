@@ -6,7 +6,7 @@ from lightning.pytorch import seed_everything
 from omegaconf import OmegaConf
 from torch.utils.data.dataloader import default_collate
 
-from geobench_exp.torch_toolbox.dataset import get_transform
+from geobench_exp.torch_toolbox.dataset import get_batch_transform, get_transform
 from geobench_exp.torch_toolbox.model_utils import generate_trainer
 from .job import Job
 
@@ -31,18 +31,19 @@ def run(job_dir: str) -> None:
     # instantiate the model
     model = instantiate(config.model, task_specs=task_specs)
 
-    # instantiate the trainer
+    # instantiate the trainer, additions made by generate_trainer are written to config in place
     trainer = generate_trainer(config=config, job=job)
-    # load config new because there might have been additions in generate_trainer function
-    config = OmegaConf.create(job.config)
 
+    transform = get_transform(task_specs=task_specs, config=config)
     datamodule = instantiate(
         config.datamodule,
         task_specs=task_specs,
         benchmark_dir=config["experiment"]["benchmark_dir"],
         partition_name=config["experiment"]["partition_name"],
-        train_transform=get_transform(task_specs=task_specs, config=config, train=True),
-        eval_transform=get_transform(task_specs=task_specs, config=config, train=False),
+        train_transform=transform,
+        eval_transform=transform,
+        train_batch_transform=get_batch_transform(task_specs=task_specs, config=config, train=True),
+        eval_batch_transform=get_batch_transform(task_specs=task_specs, config=config, train=False),
         collate_fn=default_collate,
     )
 
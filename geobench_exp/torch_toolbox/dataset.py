@@ -1,25 +1,36 @@
 """geobench.dataset Datamodule."""
 
 
-from typing import Any, Callable, Dict, Sequence
+from typing import Any, Callable, Dict, Sequence, Tuple
 
 import kornia.augmentation as K
 import numpy as np
 import torch
-from geobench.dataset import Band, Sample
+from geobench.dataset import Sample
 from geobench.task import TaskSpecifications
 from kornia.augmentation import ImageSequential
 from lightning import LightningDataModule
+from torch import Tensor
 from torch.utils.data import DataLoader
 from torchgeo.transforms import AugmentationSequential
 
 
-def get_transform(task_specs, config, train):
-    """Decide which transforms to get."""
+def get_transform(task_specs, config):
+    """Decide which per-sample transform to get."""
     if "classification" in task_specs.benchmark_name:
-        return get_classification_transform(task_specs, config, train)
+        return get_classification_transform(task_specs, config)
     elif "segmentation" in task_specs.benchmark_name:
-        return get_segmentation_transform(task_specs, config, train)
+        return get_segmentation_transform(task_specs, config)
+    else:
+        raise NotImplementedError
+
+
+def get_batch_transform(task_specs, config, train):
+    """Decide which batch transform to get."""
+    if "classification" in task_specs.benchmark_name:
+        return get_classification_batch_transform(task_specs, config, train)
+    elif "segmentation" in task_specs.benchmark_name:
+        return get_segmentation_batch_transform(task_specs, config, train)
     else:
         raise NotImplementedError
 
@@ -37,7 +48,97 @@ def get_desired_input_sizes(model_name: str) -> int:
     return input_size_dict[model_name]
 
 
-def get_classification_transform(task_specs, config: Dict[str, Any], train=True) -> Callable[[Sample], Dict[str, Any]]:
+_normalization_stats_cache: Dict[Tuple[Any, ...], Tuple[Sequence[float], Sequence[float]]] = {}
+
+
+def get_normalization_stats(
+    task_specs, config: Dict[str, Any], rgb: bool = False
+) -> Tuple[Sequence[float], Sequence[float]]:
+    """Return the band statistics of the train split, computed once per dataset and band selection.
+
+    Args:
+        task_specs: task specs to retrieve dataset
+        config: config file for dataset specifics
+        rgb: whether to return the rgb statistics instead of the per-band normalization statistics
+
+    Returns:
+        mean and std for each selected band
+    """
+    band_names = tuple(config["datamodule"]["band_names"])
+    partition_name = config["experiment"]["partition_name"]
+    file_format = config["datamodule"]["format"]
+    # key on the resolved dataset directory, so that datasets with the same names under different roots don't collide
+    key = (task_specs.get_dataset_dir().resolve(), partition_name, file_format, band_names, rgb)
+    if key not in _normalization_stats_cache:
+        dataset = task_specs.get_dataset(
+            split="train", format=file_format, band_names=band_names, partition_name=partition_name
+        )
+        _normalization_stats_cache[key] = dataset.rgb_stats() if rgb else dataset.normalization_stats()
+    return _normalization_stats_cache[key]
+
+
+class _Normalize:
+    """Normalize a batch in place with per-channel statistics.
+
+    The statistics are kept as (1, C, 1, 1) tensors and moved to the device of the
+    first batch, so normalizing is a single fused subtract and multiply per batch.
+    """
+
+    def __init__(self, mean: Sequence[float], std: Sequence[float]) -> None:
+        """Initialize new instance of _Normalize.
+
+        Args:
+            mean: per-channel mean
+            std: per-channel standard deviation
+        """
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        self.inv_std = 1.0 / torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+
+    def __call__(self, x: Tensor) -> Tensor:
+        """Cast x (N, C, H, W) to float32 if needed and normalize it in place."""
+        if self.mean.device != x.device:
+            self.mean, self.inv_std = self.mean.to(x.device), self.inv_std.to(x.device)
+        return x.to(torch.float32).sub_(self.mean).mul_(self.inv_std)
+
+
+# dtypes that torch.from_numpy can wrap as is, anything else is cast to float32 on the CPU
+_TENSOR_DTYPES = {
+    np.dtype(dtype) for dtype in ("bool", "uint8", "int8", "int16", "int32", "int64", "float16", "float32")
+}
+
+
+def _from_numpy(x: "np.typing.NDArray[Any]") -> Tensor:
+    """Wrap x as a tensor, keeping its dtype so that the cast to float32 happens on the device."""
+    if x.dtype not in _TENSOR_DTYPES:
+        x = x.astype("float32")
+    return torch.from_numpy(x)
+
+
+def get_classification_transform(task_specs, config: Dict[str, Any]) -> Callable[[Sample], Dict[str, Any]]:
+    """Define the per-sample transformation that packs a Sample into tensors.
+
+    Augmentations are applied later on whole batches, see :func:`get_classification_batch_transform`.
+
+    Args:
+        task_specs: task specs to retrieve dataset
+        config: config file for dataset specifics
+
+    Returns:
+        callable function that converts a Sample to an input tensor (C, H, W) and its label
+    """
+    # resolve the band selection once, outside of the per-sample closure shipped to the workers
+    band_names = tuple(config["datamodule"]["band_names"])
+
+    def transform(sample: Sample):
+        x: "np.typing.NDArray[Any]" = sample.pack_to_3d(band_names=band_names)[0]
+        return {"input": _from_numpy(x).permute(2, 0, 1), "label": sample.label}
+
+    return transform
+
+
+def get_classification_batch_transform(
+    task_specs, config: Dict[str, Any], train=True
+) -> Callable[[Dict[str, Tensor]], Dict[str, Tensor]]:
     """Define data transformations specific to the models generated.
 
     Args:
@@ -46,37 +147,25 @@ def get_classification_transform(task_specs, config: Dict[str, Any], train=True)
         train: train mode true or false
 
     Returns:
-        callable function that applies transformations on input data
+        callable function that applies transformations on a collated batch
     """
-
-    mean, std = task_specs.get_dataset(
-        split="train",
-        format=config["datamodule"]["format"],
-        band_names=tuple(config["datamodule"]["band_names"]),
-        partition_name=config["experiment"]["partition_name"],
-    ).normalization_stats()
+    mean, std = get_normalization_stats(task_specs, config)
 
     desired_input_size = get_desired_input_sizes(config["model"]["model"])
 
+    normalize = _Normalize(mean, std)
+    augmentations = []
     if train:
-        t = ImageSequential(
-            K.Normalize(mean=torch.Tensor(mean), std=torch.Tensor(std)),
-            K.RandomHorizontalFlip(p=0.5),
-            K.RandomVerticalFlip(p=0.5),
-            K.Resize((desired_input_size, desired_input_size)),
-        )
-    else:
-        t = ImageSequential(
-            K.Normalize(mean=torch.Tensor(mean), std=torch.Tensor(std)),
-            K.Resize((desired_input_size, desired_input_size)),
-        )
+        augmentations += [K.RandomHorizontalFlip(p=0.5), K.RandomVerticalFlip(p=0.5)]
+    # only interpolate when the patches do not already match the model input size
+    if tuple(task_specs.patch_size) != (desired_input_size, desired_input_size):
+        augmentations.append(K.Resize((desired_input_size, desired_input_size)))
+    t = ImageSequential(*augmentations) if augmentations else None
 
-    def transform(sample: Sample):
-        x: "np.typing.NDArray[np.float_]" = sample.pack_to_3d(band_names=config["datamodule"]["band_names"])[0].astype(
-            "float32"
-        )
-        x = t(torch.from_numpy(x).permute(2, 0, 1)).squeeze(0)
-        return {"input": x, "label": sample.label}
+    def transform(batch: Dict[str, Tensor]):
+        x = normalize(batch["input"])
+        batch["input"] = t(x) if t is not None else x
+        return batch
 
     return transform
 
@@ -84,17 +173,45 @@ def get_classification_transform(task_specs, config: Dict[str, Any], train=True)
 def get_segmentation_transform(
     task_specs: TaskSpecifications,
     config: Dict[str, Any],
+):
+    """Define the per-sample transformation that packs a Sample into tensors.
+
+    Augmentations are applied later on whole batches, see :func:`get_segmentation_batch_transform`.
+
+    Args:
+        task_specs: task specs to retrieve dataset
+        config: config file for dataset specifics
+
+    Returns:
+        callable function that converts a Sample to an input tensor (C, H, W) and a mask (H, W)
+    """
+    band_names = tuple(config["datamodule"]["band_names"])
+
+    def transform(sample: Sample):
+        x = sample.pack_to_3d(band_names=band_names)[0]
+
+        return {
+            "input": _from_numpy(x).permute(2, 0, 1),
+            "label": _from_numpy(sample.label.data),
+        }
+
+    return transform
+
+
+def get_segmentation_batch_transform(
+    task_specs: TaskSpecifications,
+    config: Dict[str, Any],
     train=True,
 ):
     """Define data transformations specific to the models generated.
 
     Args:
         task_specs: task specs to retrieve dataset
-        hparams: model hyperparameters
+        config: config file for dataset specifics
         train: train mode true or false
 
     Returns:
-        callable function that applies transformations on input data
+        callable function that applies transformations on a collated batch
     """
     h, w = 224, 224
     patch_h, patch_w = task_specs.patch_size
@@ -102,18 +219,11 @@ def get_segmentation_transform(
         raise (RuntimeError("Only square patches are supported in this version"))
     h32 = w32 = int(32 * (h // 32))  # make input res multiple of 32
 
-    mean, std = task_specs.get_dataset(
-        split="train",
-        format=config["datamodule"]["format"],
-        band_names=tuple(config["datamodule"]["band_names"]),
-        # benchmark_dir=config["experiment"]["benchmark_dir"],
-        partition_name=config["experiment"]["partition_name"],
-    ).rgb_stats()
-    band_names = config["datamodule"]["band_names"]
+    mean, std = get_normalization_stats(task_specs, config, rgb=True)
 
+    normalize = _Normalize(mean, std)
     if train:
         t = AugmentationSequential(
-            K.Normalize(mean=torch.Tensor(mean), std=torch.Tensor(std)),
             K.RandomHorizontalFlip(p=0.5),
             K.RandomVerticalFlip(p=0.5),
             K.Resize((h32, w32)),
@@ -121,25 +231,15 @@ def get_segmentation_transform(
         )
     else:
         t = AugmentationSequential(
-            K.Normalize(mean=torch.Tensor(mean), std=torch.Tensor(std)),
             K.Resize((h32, w32)),
             data_keys=["image", "mask"],
         )
 
-    def transform(sample: Sample):
-        x = sample.pack_to_3d(band_names=band_names)[0].astype("float32")
-
-        if isinstance(sample.label, Band):
-            # kornia expects channel first and label to have a channel
-            x, y = torch.from_numpy(x).permute(2, 0, 1), torch.from_numpy(
-                sample.label.data.astype("float32")
-            ).unsqueeze(0)
-            transformed = t({"image": x, "mask": y})
-
-        return {
-            "input": transformed["image"].squeeze(0),
-            "label": transformed["mask"].squeeze(0).to(dtype=torch.long),
-        }
+    def transform(batch: Dict[str, Tensor]):
+        transformed = t({"image": normalize(batch["input"]), "mask": batch["label"].to(torch.float32)})
+        batch["input"] = transformed["image"]
+        batch["label"] = transformed["mask"].to(dtype=torch.long)
+        return batch
 
     return transform
 
@@ -150,6 +250,12 @@ class DataModule(LightningDataModule):
     Define a
     `PyTorch Lightning <https://pytorch-lightning.readthedocs.io/en/stable/extensions/datamodules.html>`_
     that provides dataloaders from task_specs.
+
+    The dataloaders only apply the per-sample transforms, so their batches hold raw band values in the dtype
+    stored on disk. Normalization, augmentations and resizing are applied by the batch transforms in
+    :meth:`on_after_batch_transfer`, which is only called when the datamodule is attached to a Trainer.
+    When iterating the dataloaders by hand, apply ``train_batch_transform`` or ``eval_batch_transform``
+    to each batch yourself.
     """
 
     def __init__(
@@ -162,9 +268,14 @@ class DataModule(LightningDataModule):
         val_batch_size: int = None,
         train_transform=None,
         eval_transform=None,
+        train_batch_transform=None,
+        eval_batch_transform=None,
         collate_fn=None,
         band_names: Sequence[str] = ("red", "green", "blue"),
         format: str = "hdf5",
+        pin_memory: bool = True,
+        persistent_workers: bool = True,
+        prefetch_factor: int = 2,
     ) -> None:
         """Initialize new instance of DataModule .
 
@@ -175,10 +286,21 @@ class DataModule(LightningDataModule):
             batch_size: The size of the mini-batch.
             num_workers: The number of parallel workers for loading samples from the hard-drive.
             val_batch_size: Tes size of the batch for the validation set and test set. If None, will use batch_size.
-            transform: Callable transforming a Sample. Executed on a worker and the output will be provided to collate_fn.
+            train_transform: Callable transforming a Sample of the train split. Executed on a worker and the output
+                will be provided to collate_fn.
+            eval_transform: Callable transforming a Sample of the validation and test splits.
+            train_batch_transform: Callable transforming a collated train batch, executed on the device the batch
+                was moved to.
+            eval_batch_transform: Callable transforming a collated validation or test batch.
             collate_fn: A callable passed to the DataLoader. Maps a list of Sample to dictionnary of stacked torch tensors.
             band_names: multi spectral bands to select
             file_format: 'hdf5' or 'tif'
+            pin_memory: Whether to return batches in page-locked memory for faster host to GPU copies.
+                Only has an effect when CUDA is available.
+            persistent_workers: Whether to keep the workers alive between epochs instead of forking new ones.
+                Only has an effect when num_workers > 0.
+            prefetch_factor: Number of batches loaded in advance by each worker.
+                Only has an effect when num_workers > 0.
         """
         super().__init__()
         self.task_specs = task_specs
@@ -189,69 +311,84 @@ class DataModule(LightningDataModule):
         self.num_workers = num_workers
         self.train_transform = train_transform
         self.eval_transform = eval_transform
+        self.train_batch_transform = train_batch_transform
+        self.eval_batch_transform = eval_batch_transform
         self.collate_fn = collate_fn
         self.band_names = band_names
         self.format = format
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
+        # datasets are opened once per split and shared by all the dataloaders built from it
+        self._datasets: Dict[str, Any] = {}
 
-    def train_dataloader(self) -> DataLoader:
-        """Create the train dataloader."""
-        return DataLoader(
-            self.task_specs.get_dataset(
-                split="train",
+    def _dataset(self, split: str):
+        """Return the dataset of a split of the active partition, opening it on first use.
+
+        Args:
+            split: one of 'train', 'valid' or 'test', the train split uses train_transform and the others eval_transform
+        """
+        if split not in self._datasets:
+            self._datasets[split] = self.task_specs.get_dataset(
+                split=split,
                 partition_name=self.partition_name,
-                transform=self.train_transform,
+                transform=self.train_transform if split == "train" else self.eval_transform,
                 band_names=self.band_names,
                 format=self.format,
-            ),
-            batch_size=self.batch_size,
-            shuffle=True,
+            )
+        return self._datasets[split]
+
+    def _dataloader(self, split: str, batch_size: int, shuffle: bool) -> DataLoader:
+        """Create a dataloader for a split of the active partition.
+
+        Args:
+            split: one of 'train', 'valid' or 'test'
+            batch_size: size of the mini-batch
+            shuffle: whether to reshuffle the samples at every epoch
+        """
+        # worker options are rejected by DataLoader when loading in the main process
+        worker_kwargs: Dict[str, Any] = {}
+        if self.num_workers > 0:
+            worker_kwargs = {"persistent_workers": self.persistent_workers, "prefetch_factor": self.prefetch_factor}
+        return DataLoader(
+            self._dataset(split),
+            batch_size=batch_size,
+            shuffle=shuffle,
             num_workers=self.num_workers,
             collate_fn=self.collate_fn,
+            pin_memory=self.pin_memory,
+            **worker_kwargs,
         )
 
+    def on_after_batch_transfer(self, batch: Dict[str, Tensor], dataloader_idx: int) -> Dict[str, Tensor]:
+        """Apply the batch transform once the batch is on its device.
+
+        Args:
+            batch: collated batch
+            dataloader_idx: index of the dataloader the batch comes from
+
+        Returns:
+            transformed batch
+        """
+        if self.trainer is not None and self.trainer.training:
+            batch_transform = self.train_batch_transform
+        else:
+            batch_transform = self.eval_batch_transform
+        if batch_transform is not None:
+            batch = batch_transform(batch)
+        return batch
+
+    def train_dataloader(self) -> DataLoader:
+        """Create the train dataloader."""
+        return self._dataloader("train", self.batch_size, shuffle=True)
+
     def val_dataloader(self) -> DataLoader:
         """Create the validation dataloader."""
         return (
-            DataLoader(
-                self.task_specs.get_dataset(
-                    split="valid",
-                    partition_name=self.partition_name,
-                    transform=self.eval_transform,
-                    band_names=self.band_names,
-                    format=self.format,
-                ),
-                batch_size=self.val_batch_size,
-                shuffle=False,
-                num_workers=self.num_workers,
-                collate_fn=self.collate_fn,
-            ),
-            DataLoader(
-                self.task_specs.get_dataset(
-                    split="test",
-                    partition_name=self.partition_name,
-                    transform=self.eval_transform,
-                    band_names=self.band_names,
-                    format=self.format,
-                ),
-                batch_size=self.val_batch_size,
-                shuffle=False,
-                num_workers=self.num_workers,
-                collate_fn=self.collate_fn,
-            ),
+            self._dataloader("valid", self.val_batch_size, shuffle=False),
+            self._dataloader("test", self.val_batch_size, shuffle=False),
         )
 
     def test_dataloader(self) -> DataLoader:
         """Create the test dataloader."""
-        return DataLoader(
-            self.task_specs.get_dataset(
-                split="test",
-                partition_name=self.partition_name,
-                transform=self.eval_transform,
-                band_names=self.band_names,
-                format=self.format,
-            ),
-            batch_size=self.val_batch_size,
-            shuffle=False,
-            num_workers=self.num_workers,
-            collate_fn=self.collate_fn,
-        )
+        return self._dataloader("test", self.val_batch_size, shuffle=False)
@@ -31,6 +31,8 @@ class GeoBenchBaseModule(LightningModule):
         freeze_backbone: bool = False,
         optimizer: OptimizerCallable = torch.optim.Adam,
         lr_scheduler: Optional[LRSchedulerCallable] = None,
+        compile_model: bool = False,
+        channels_last: bool = False,
     ) -> None:
         """Initialize a new ClassificationTask instance.
 
@@ -46,6 +48,8 @@ class GeoBenchBaseModule(LightningModule):
                 the classifier head.
             optimizer: Optimizer to use for training
             lr_scheduler: Learning rate scheduler to use for training
+            compile_model: Compile the model with torch.compile to fuse its kernels
+            channels_last: Run the model and its inputs in the channels_last (NHWC) memory format
         """
         super().__init__()
         self.task_specs = task_specs
@@ -59,6 +63,12 @@ class GeoBenchBaseModule(LightningModule):
         self.test_metrics = eval_metrics_generator(task_specs)
 
         self.configure_the_model()
+        self.channels_last = channels_last
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if compile_model:
+            # compile in place so that state dict keys stay the same as for the eager model
+            self.model.compile()
 
     def forward(self, x: Tensor) -> Tensor:
         """Forward pass.
@@ -69,6 +79,8 @@ class GeoBenchBaseModule(LightningModule):
         Returns:
             Tensor (N, num_classes)
         """
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         return self.model(x)
 
     def configure_the_model(self) -> None:
@@ -195,11 +207,15 @@ class GeoBenchClassifier(GeoBenchBaseModule):
         freeze_backbone: bool = False,
         optimizer: OptimizerCallable = torch.optim.Adam,
         lr_scheduler: Optional[LRSchedulerCallable] = None,
+        compile_model: bool = False,
+        channels_last: bool = False,
     ) -> None:
         self.save_hyperparameters(ignore=["loss_fn", "task_specs"])
         self.hparams["model"] = model
         self.weights = weights
-        super().__init__(task_specs, in_channels, freeze_backbone, optimizer, lr_scheduler)
+        super().__init__(
+            task_specs, in_channels, freeze_backbone, optimizer, lr_scheduler, compile_model, channels_last
+        )
 
     def configure_the_model(self) -> None:
         """Configure classification model."""
@@ -241,10 +257,14 @@ class GeoBenchSegmentation(GeoBenchBaseModule):
         freeze_backbone: bool = False,
         optimizer: OptimizerCallable = torch.optim.Adam,
         lr_scheduler: Optional[LRSchedulerCallable] = None,
+        compile_model: bool = False,
+        channels_last: bool = False,
     ) -> None:
         self.save_hyperparameters(ignore=["loss_fn", "task_specs"])
 
-        super().__init__(task_specs, in_channels, freeze_backbone, optimizer, lr_scheduler)
+        super().__init__(
+            task_specs, in_channels, freeze_backbone, optimizer, lr_scheduler, compile_model, channels_last
+        )
 
     def configure_the_model(self) -> None:
         """Configure segmentation model."""
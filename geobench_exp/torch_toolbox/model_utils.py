@@ -2,6 +2,7 @@ import os
 import random
 import string
 
+import torch
 from hydra.utils import instantiate
 from lightning import Trainer
 from lightning.pytorch.callbacks import ModelCheckpoint
@@ -40,6 +41,12 @@ def generate_trainer(config: dict, job) -> Trainer:
             )
         )
 
+    # bf16 needs an Ampere or newer GPU, use fp16 mixed precision on older ones. The compute capability is
+    # checked directly because recent torch.cuda.is_bf16_supported() also reports emulated bf16 as supported
+    precision = str(config["trainer"].get("precision", ""))
+    if precision.startswith("bf16") and torch.cuda.is_available() and torch.cuda.get_device_capability()[0] < 8:
+        config["trainer"]["precision"] = "16-mixed"
+
     job.save_config(config, overwrite=True)
 
     ckpt_dir = os.path.join(job.dir, "checkpoint")
@@ -3,6 +3,7 @@
 from typing import Any, List, Union
 
 import torch
+import torch.nn.functional as F
 from torch import Tensor
 
 
@@ -43,5 +44,5 @@ class ClassificationHead(torch.nn.Module):
             if isinstance(x, list):
                 x = x[-1]
             if len(x.size()) > 2:
-                x = x.mean((2, 3))
+                x = F.adaptive_avg_pool2d(x, 1).flatten(1)
             return self.linear(x)
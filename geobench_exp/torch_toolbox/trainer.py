@@ -4,7 +4,7 @@
 import argparse
 import os
 
-from dataset import get_transform
+from dataset import get_batch_transform, get_transform
 from hydra.utils import instantiate
 from lightning.pytorch import seed_everything
 from model_utils import generate_trainer
@@ -35,17 +35,18 @@ def train(job_dir: str) -> None:
     model = instantiate(config.model, task_specs=task_specs)
 
     # TODO this should be done with hydra
+    # additions made by generate_trainer are written to config in place
     trainer = generate_trainer(config=config, job=job)
 
-    # load config new because there might have been additions in generate_trainer function
-    config = job.config
-
     # TODO this should be done with hydra
+    transform = get_transform(task_specs=task_specs, config=config)
     datamodule = instantiate(
         config.datamodule,
         task_specs=task_specs,
-        train_transform=get_transform(task_specs=task_specs, config=config, train=True),
-        eval_transform=get_transform(task_specs=task_specs, config=config, train=False),
+        train_transform=transform,
+        eval_transform=transform,
+        train_batch_transform=get_batch_transform(task_specs=task_specs, config=config, train=True),
+        eval_batch_transform=get_batch_transform(task_specs=task_specs, config=config, train=False),
         collate_fn=default_collate,
     )
     # datamodule = DataModule(
@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 from geobench.benchmark.dataset_converters import crop_type_south_africa, eurosat
@@ -24,5 +25,11 @@ def create_segmentation_test_benchmark():
 
 
 if __name__ == "__main__":
-    create_classification_test_benchmark()
-    create_segmentation_test_benchmark()
+    # the two benchmarks share no state, so convert them in parallel
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(create_classification_test_benchmark),
+            executor.submit(create_segmentation_test_benchmark),
+        ]
+        for future in as_completed(futures):
+            future.result()
@@ -0,0 +1,30 @@
+"""Test job.py"""
+
+from pathlib import Path
+
+from geobench_exp.job import Job
+
+
+def test_get_metrics_csv(tmp_path: Path):
+    job = Job(tmp_path)
+    job.save_config({"experiment": {"loggers": ["csv"]}})
+
+    log_dir = tmp_path / "csv_logs" / "version_0"
+    log_dir.mkdir(parents=True)
+    with open(log_dir / "metrics.csv", "w") as fd:
+        fd.write("epoch,step,train_loss,val_Accuracy,test_Accuracy\n")
+        fd.write("0,9,0.9,,\n")
+        fd.write("0,9,,0.5,\n")
+        fd.write("1,19,0.4,,\n")
+        fd.write("1,19,,0.7,\n")
+        fd.write("1,19,,,0.65\n")
+
+    metrics = job.get_metrics()
+
+    assert metrics == {
+        "epoch": "1",
+        "step": "19",
+        "train_loss": "0.4",
+        "val_Accuracy": "0.7",
+        "test_Accuracy": "0.65",
+    }
@@ -0,0 +1,134 @@
+"""Test dataset.py"""
+
+import json
+import shutil
+from pathlib import Path
+
+import geobench.task
+import pytest
+import torch
+import torch.nn.functional as F
+from geobench.task import load_task_specs
+from torch.utils.data import default_collate
+
+from geobench_exp.torch_toolbox.dataset import DataModule, get_batch_transform, get_normalization_stats, get_transform
+
+DATA_DIR = Path("tests", "data").absolute()
+
+
+@pytest.fixture(autouse=True)
+def geo_bench_dir(monkeypatch):
+    # task specs resolve their dataset directory from GEO_BENCH_DIR, point it to the test data
+    monkeypatch.setattr(geobench.task, "GEO_BENCH_DIR", DATA_DIR)
+
+
+def get_config(band_names):
+    return {
+        "experiment": {"partition_name": "default"},
+        "datamodule": {"band_names": band_names, "format": "hdf5"},
+        "model": {"model": "resnet18"},
+    }
+
+
+def load_batch(task_specs, config):
+    dataset = task_specs.get_dataset(
+        split="train",
+        transform=get_transform(task_specs, config),
+        band_names=config["datamodule"]["band_names"],
+        format=config["datamodule"]["format"],
+    )
+    return default_collate([dataset[0], dataset[1]]), dataset
+
+
+def expected_input(x, mean, std):
+    """Normalize and resize x to 224 x 224, sorting the values of each channel so flips don't matter.
+
+    Raw band values are large, so float32 rounding differs slightly from the fused normalization of the batch transforms.
+    """
+    mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+    std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+    x = F.interpolate((x.float() - mean) / std, size=(224, 224), mode="bilinear", align_corners=True)
+    return x.flatten(2).sort(dim=-1).values
+
+
+@pytest.mark.parametrize("train", [True, False])
+def test_classification_transforms(train: bool):
+    task_specs = load_task_specs(DATA_DIR / "geobench-classification-test" / "eurosat")
+    config = get_config(["red", "green", "blue"])
+    batch, dataset = load_batch(task_specs, config)
+    raw = batch["input"].clone()
+
+    batch = get_batch_transform(task_specs, config, train=train)(batch)
+
+    assert batch["input"].shape == (2, 3, 224, 224)
+    assert batch["input"].dtype == torch.float32
+    assert batch["label"].shape == (2,)
+    mean, std = dataset.normalization_stats()
+    torch.testing.assert_close(
+        batch["input"].flatten(2).sort(dim=-1).values, expected_input(raw, mean, std), atol=1e-3, rtol=1e-4
+    )
+
+
+@pytest.mark.parametrize("train", [True, False])
+def test_segmentation_transforms(train: bool):
+    task_specs = load_task_specs(DATA_DIR / "geobench-segmentation-test" / "southAfricaCropType")
+    config = get_config(["red", "green", "blue"])
+    batch, dataset = load_batch(task_specs, config)
+    raw = batch["input"].clone()
+    raw_label = batch["label"].clone()
+
+    batch = get_batch_transform(task_specs, config, train=train)(batch)
+
+    assert batch["input"].shape == (2, 3, 224, 224)
+    assert batch["input"].dtype == torch.float32
+    assert batch["label"].shape == (2, 224, 224)
+    assert batch["label"].dtype == torch.long
+    assert set(batch["label"].unique().tolist()) <= set(raw_label.unique().tolist())
+    mean, std = dataset.rgb_stats()
+    torch.testing.assert_close(
+        batch["input"].flatten(2).sort(dim=-1).values, expected_input(raw, mean, std), atol=1e-3, rtol=1e-4
+    )
+
+
+def test_datamodule_shares_datasets():
+    task_specs = load_task_specs(DATA_DIR / "geobench-classification-test" / "eurosat")
+    config = get_config(["red", "green", "blue"])
+    train_transform, eval_transform = get_transform(task_specs, config), get_transform(task_specs, config)
+    datamodule = DataModule(
+        task_specs=task_specs,
+        benchmark_dir=str(DATA_DIR / "geobench-classification-test"),
+        partition_name="default",
+        batch_size=2,
+        num_workers=0,
+        train_transform=train_transform,
+        eval_transform=eval_transform,
+    )
+
+    train_dataset = datamodule.train_dataloader().dataset
+    valid_loader, test_loader = datamodule.val_dataloader()
+
+    assert datamodule.train_dataloader().dataset is train_dataset
+    assert datamodule.test_dataloader().dataset is test_loader.dataset
+    assert train_dataset.transform is train_transform
+    assert valid_loader.dataset.transform is eval_transform
+    assert test_loader.dataset.transform is eval_transform
+
+
+def test_normalization_stats_per_dataset_dir(tmp_path: Path, monkeypatch):
+    task_specs = load_task_specs(DATA_DIR / "geobench-classification-test" / "eurosat")
+    config = get_config(["red", "green", "blue"])
+    mean, _ = get_normalization_stats(task_specs, config)
+
+    # same benchmark and dataset names under another root, with a different red mean
+    dataset_dir = tmp_path / "geobench-classification-test" / "eurosat"
+    shutil.copytree(DATA_DIR / "geobench-classification-test" / "eurosat", dataset_dir)
+    with open(dataset_dir / "band_stats.json", "r") as fd:
+        band_stats = json.load(fd)
+    band_stats["04 - Red"]["mean"] += 1.0
+    with open(dataset_dir / "band_stats.json", "w") as fd:
+        json.dump(band_stats, fd)
+    monkeypatch.setattr(geobench.task, "GEO_BENCH_DIR", tmp_path)
+
+    other_mean, _ = get_normalization_stats(task_specs, config)
+
+    assert other_mean[0] == pytest.approx(mean[0] + 1.0)